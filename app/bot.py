@@ -29,6 +29,7 @@ from app.services import (
     list_recent_orders,
     list_users,
     remove_user,
+    today_start_utc,
 )
 
 router = Router()
@@ -179,9 +180,10 @@ def _orders_text(marketplace: Marketplace) -> str:
 
 def _today_summary_text() -> str:
     with session_scope() as session:
-        daily = build_today_summary(session)
-        wb = build_summary(session, Marketplace.WB)
-        ozon = build_summary(session, Marketplace.OZON)
+        today_start = today_start_utc()
+        daily = build_today_summary(session, today_start)
+        wb = build_summary(session, Marketplace.WB, today_start)
+        ozon = build_summary(session, Marketplace.OZON, today_start)
 
     return (
         f"<b>Сводка за сегодня ({daily.date})</b>\n\n"
@@ -1,7 +1,7 @@
 from contextlib import contextmanager
 from pathlib import Path
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
 from app.config import settings
@@ -56,3 +56,27 @@ def session_scope():
     finally:
         session.close()
 
+
+@contextmanager
+def advisory_lock(key: int):
+    """
+    Межпроцессная блокировка через pg_try_advisory_lock.
+    Отдаёт False, если блокировку держит другой процесс. На не-PostgreSQL базах
+    (SQLite — один процесс) всегда отдаёт True.
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+
+    # Advisory lock привязан к соединению — держим своё соединение до освобождения
+    with engine.connect() as connection:
+        acquired = bool(
+            connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key}).scalar()
+        )
+        connection.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                connection.commit()
@@ -29,6 +29,7 @@ from app.schemas import (
 )
 from app.services import (
     build_summary,
+    close_http_client,
     ensure_owner_user,
     export_rows,
     get_settings,
@@ -37,6 +38,7 @@ from app.services import (
     save_settings,
     status_catalog,
     sync_orders_from_marketplaces,
+    today_start_utc,
 )
 
 logger = logging.getLogger(__name__)
@@ -149,6 +151,7 @@ async def startup_event() -> None:
 async def shutdown_event() -> None:
     if scheduler and scheduler.running:
         scheduler.shutdown(wait=False)
+    await close_http_client()
     if bot_instance:
         await bot_instance.session.close()
 
@@ -215,7 +218,8 @@ def dashboard_marketplace_endpoint(
 def dashboard_all_endpoint(
     session: Session = Depends(get_session),
 ) -> list[DashboardSummary]:
-    return [build_summary(session, marketplace) for marketplace in Marketplace]
+    today_start = today_start_utc()
+    return [build_summary(session, marketplace, today_start) for marketplace in Marketplace]
 
 
 @app.get("/api/settings", response_model=SettingsRead)
@@ -1,18 +1,26 @@
 import asyncio
-import dataclasses
-import json
 import logging
+import math
+import random
+import re
+import time
+from contextlib import ExitStack
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta, timezone
-from typing import Any
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from itertools import chain, groupby
+from operator import attrgetter, itemgetter
+from typing import Any, Awaitable, Callable, Iterable, NamedTuple
 from zoneinfo import ZoneInfo
 
 import httpx
-from sqlalchemy import and_, func, or_, select
-from sqlalchemy.orm import Session, selectinload
+import orjson
+from sqlalchemy import and_, case, func, insert, or_, select, update
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.orm import Session, raiseload
 
 from app.config import settings as app_settings
-from app.db import session_scope
+from app.db import advisory_lock, session_scope
 from app.enums import MARKETPLACE_LABELS, STATUS_LABELS, Marketplace, OrderStatus, UserRole
 from app.models import Order, OrderEvent, Settings, User
 from app.schemas import (
@@ -29,10 +37,19 @@ from app.schemas import (
 logger = logging.getLogger(__name__)
 
 SYNC_LOCK = asyncio.Lock()
-REQUEST_PAUSE_SECONDS = 0.45
+# Ключ pg advisory lock синхронизации — общий для всех воркеров и реплик
+SYNC_ADVISORY_KEY = 0x6F7467
+WB_REQUESTS_PER_SECOND = 10.0
+OZON_REQUESTS_PER_SECOND = 5.0
 MAX_WB_PAGES = 20
 MAX_OZON_PAGES = 30
+OZON_PAGE_SIZE = 50
+OZON_PAGE_CONCURRENCY = 4
+MAX_RETRY_ATTEMPTS = 5
+# Верхняя граница Retry-After: пока идёт пауза, синхронизация держит SYNC_LOCK и advisory lock
+MAX_RETRY_AFTER_SECONDS = 60.0
 RECENT_ORDERS_DAYS = 30
+PREFETCH_CHUNK_SIZE = 500
 
 WB_NEW_ORDERS_URL = "https://marketplace-api.wildberries.ru/api/v3/orders/new"
 WB_ORDERS_URL = "https://marketplace-api.wildberries.ru/api/v3/orders"
@@ -40,17 +57,54 @@ WB_SUPPLY_URL = "https://marketplace-api.wildberries.ru/api/v3/supplies/{supply_
 WB_STATISTICS_URL = "https://statistics-api.wildberries.ru/api/v1/supplier/orders"
 OZON_FBS_LIST_URL = "https://api-seller.ozon.ru/v3/posting/fbs/list"
 
+# Ключи номера сборочного задания в порядке приоритета
+_WB_TASK_KEYS = ("id", "rid", "srid")
+_OZON_TASK_KEYS = ("posting_number", "order_number", "order_id")
+
+WB_SUPPLY_DONE_RE = re.compile(rb'"done"\s*:\s*(true|false)')
+SRID_CHARS_RE = re.compile(r"[^\W\d_]|\.")
+
+
+class AsyncRateLimiter:
+    """
+    Ограничитель исходящих запросов к одному хосту (token bucket в форме GCRA).
+    Темп задаётся числом запросов в секунду и не зависит от времени ответа API.
+    Слот резервируется синхронно, без asyncio.Lock, поэтому объект не привязан к event loop.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self._interval = 1.0 / rate
+        self._burst_window = (burst - 1) * self._interval
+        self._next_at = 0.0
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        start = max(self._next_at, now - self._burst_window)
+        self._next_at = start + self._interval
+        delay = start - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+WB_RATE_LIMITER = AsyncRateLimiter(WB_REQUESTS_PER_SECOND)
+OZON_RATE_LIMITER = AsyncRateLimiter(OZON_REQUESTS_PER_SECOND)
+# Общий HTTP клиент маркетплейсов, создаётся лениво при первой синхронизации
+_HTTP_CLIENT: httpx.AsyncClient | None = None
+# Event loop, в котором создан _HTTP_CLIENT: его соединения привязаны к этому loop
+_HTTP_CLIENT_LOOP: asyncio.AbstractEventLoop | None = None
+
 
 def get_user_by_telegram_id(session: Session, telegram_id: int) -> User | None:
     return session.get(User, telegram_id)
 
 
 def list_users(session: Session) -> list[User]:
-    items = list(session.scalars(select(User)).all())
-    return sorted(
-        items,
-        key=lambda item: (0 if item.role == UserRole.OWNER else 1, item.added_at, item.telegram_id),
+    query = select(User).order_by(
+        case((User.role == UserRole.OWNER, 0), else_=1),
+        User.added_at,
+        User.telegram_id,
     )
+    return list(session.scalars(query).all())
 
 
 def add_admin_user(session: Session, telegram_id: int, full_name: str, added_by: int) -> User:
@@ -97,8 +151,9 @@ def ensure_owner_user(session: Session) -> bool:
     return True
 
 
-@dataclass(slots=True)
-class ExternalOrderSnapshot:
+class ExternalOrderSnapshot(NamedTuple):
+    """Нормализованный снимок заказа маркетплейса (неизменяемый)."""
+
     marketplace: Marketplace
     assembly_task_number: str
     status: OrderStatus
@@ -108,7 +163,11 @@ class ExternalOrderSnapshot:
     quantity: int
     due_ship_at: datetime | None
     source_status: str
-    wb_rid: str | None = field(default=None)
+    wb_rid: str | None = None
+
+
+# Ключ заказа (marketplace, номер) — attrgetter собирает кортеж на C, без лямбды
+SNAPSHOT_KEY = attrgetter("marketplace", "assembly_task_number")
 
 
 # ─── WB статусная воронка ────────────────────────────────────────────────────
@@ -127,6 +186,14 @@ WB_FORWARD_FUNNEL: tuple[OrderStatus, ...] = (
     OrderStatus.BUYOUT,
 )
 WB_FORWARD_FUNNEL_INDEX = {status: idx for idx, status in enumerate(WB_FORWARD_FUNNEL)}
+WB_TERMINAL_STATUSES = frozenset({
+    OrderStatus.REJECTION,
+    OrderStatus.RETURN_STARTED,
+    OrderStatus.RETURN_IN_TRANSIT_FROM_BUYER,
+    OrderStatus.RETURN_ARRIVED_TO_SELLER_PICKUP,
+    OrderStatus.SELLER_PICKED_UP,
+    OrderStatus.DEFECT,
+})
 
 OZON_STATUS_MAP: dict[str, OrderStatus] = {
     "awaiting_registration": OrderStatus.NEW,
@@ -148,6 +215,22 @@ OZON_STATUS_MAP: dict[str, OrderStatus] = {
     "loss": OrderStatus.DEFECT,
 }
 
+# Все статусы с подписями в порядке enum — порядок ключей by_status в сводке
+_ALL_STATUS_LABELS: tuple[tuple[OrderStatus, str], ...] = tuple(
+    (status, STATUS_LABELS[status]) for status in OrderStatus
+)
+
+# Запасные правила для статусов Ozon вне OZON_STATUS_MAP: все подстроки правила
+# должны входить в статус; правила проверяются по порядку, первое совпавшее выигрывает
+_OZON_SUBSTR_RULES: tuple[tuple[tuple[str, ...], OrderStatus], ...] = (
+    (("cancel",), OrderStatus.REJECTION),
+    (("not_accepted",), OrderStatus.REJECTION),
+    (("return", "to_seller"), OrderStatus.RETURN_ARRIVED_TO_SELLER_PICKUP),
+    (("return",), OrderStatus.RETURN_STARTED),
+    (("deliver",), OrderStatus.IN_TRANSIT_TO_BUYER),
+    (("transit",), OrderStatus.IN_TRANSIT_TO_BUYER),
+)
+
 
 def _to_aware_utc(value: datetime) -> datetime:
     if value.tzinfo is None:
@@ -155,28 +238,51 @@ def _to_aware_utc(value: datetime) -> datetime:
     return value.astimezone(timezone.utc)
 
 
-def _parse_datetime(value: Any, fallback: datetime | None = None) -> datetime:
-    if isinstance(value, datetime):
-        return _to_aware_utc(value)
-    if value is None:
-        return fallback or datetime.now(timezone.utc)
-    text = str(value).strip()
-    if not text:
-        return fallback or datetime.now(timezone.utc)
-    if text.endswith("Z"):
-        text = f"{text[:-1]}+00:00"
+def _parse_iso_fast(text: str) -> datetime | None:
+    # На Python 3.11+ fromisoformat (C-реализация) сам понимает "Z", дробные секунды
+    # и пробел вместо "T" — это быстрее разбора срезами и strptime
     try:
         parsed = datetime.fromisoformat(text)
-        return _to_aware_utc(parsed)
     except ValueError:
-        pass
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    if parsed.tzinfo is timezone.utc:
+        return parsed
+    return parsed.astimezone(timezone.utc)
+
+
+@lru_cache(maxsize=2048)
+def _parse_datetime_text(text: str) -> datetime | None:
+    parsed = _parse_iso_fast(text)
+    if parsed is not None:
+        return parsed
+    # Медленный путь для старых версий Python: "Z" и форматы, которые fromisoformat не принимает
+    if text.endswith("Z"):
+        parsed = _parse_iso_fast(f"{text[:-1]}+00:00")
+        if parsed is not None:
+            return parsed
     for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
         try:
             parsed = datetime.strptime(text, fmt)
             return parsed.replace(tzinfo=timezone.utc)
         except ValueError:
             continue
-    return fallback or datetime.now(timezone.utc)
+    return None
+
+
+def _parse_datetime(value: Any, fallback: datetime | None = None, now: datetime | None = None) -> datetime:
+    if isinstance(value, datetime):
+        return _to_aware_utc(value)
+    if value is None:
+        return fallback or now or datetime.now(timezone.utc)
+    text = str(value).strip()
+    if not text:
+        return fallback or now or datetime.now(timezone.utc)
+    parsed = _parse_datetime_text(text)
+    if parsed is None:
+        return fallback or now or datetime.now(timezone.utc)
+    return parsed
 
 
 def _safe_int(value: Any, default: int = 1) -> int:
@@ -188,25 +294,25 @@ def _safe_int(value: Any, default: int = 1) -> int:
 
 
 def _log_marketplace_response(api_name: str, response: httpx.Response) -> None:
-    request_url = str(response.request.url)
+    # URL передаётся объектом: logging приведёт его к строке, только если запись будет выведена
+    request_url = response.request.url
     logger.info("%s API ответ: url=%s status=%s", api_name, request_url, response.status_code)
     if response.is_error:
         body_preview = response.text[:200].replace("\n", "\\n")
         logger.error("%s API ошибка: url=%s status=%s body=%s", api_name, request_url, response.status_code, body_preview)
 
 
-def _payload_preview(payload: Any, limit: int = 500) -> str:
-    try:
-        serialized = json.dumps(payload, ensure_ascii=False, default=str)
-    except (TypeError, ValueError):
-        serialized = str(payload)
-    preview = serialized[:limit].replace("\n", "\\n")
-    return f"{preview}..." if len(serialized) > limit else preview
+def _only_dicts(items: list[Any]) -> list[dict[str, Any]]:
+    # orjson отдаёт ровно dict, поэтому достаточно type(...) is dict; в типичном случае
+    # все элементы — объекты, и список возвращается без копирования
+    if all(type(item) is dict for item in items):
+        return items
+    return [item for item in items if type(item) is dict]
 
 
 def _extract_wb_orders(payload: Any) -> list[dict[str, Any]]:
     if isinstance(payload, list):
-        return [item for item in payload if isinstance(item, dict)]
+        return _only_dicts(payload)
     if not isinstance(payload, dict):
         return []
     orders_payload = payload.get("orders") or payload.get("data") or []
@@ -214,7 +320,7 @@ def _extract_wb_orders(payload: Any) -> list[dict[str, Any]]:
         orders_payload = orders_payload.get("orders", [])
     if not isinstance(orders_payload, list):
         return []
-    return [item for item in orders_payload if isinstance(item, dict)]
+    return _only_dicts(orders_payload)
 
 
 def _normalize_status_text(raw_status: str | int | None) -> str:
@@ -223,8 +329,8 @@ def _normalize_status_text(raw_status: str | int | None) -> str:
     return str(raw_status).strip().lower()
 
 
-def _recent_period_utc(days: int = RECENT_ORDERS_DAYS) -> tuple[datetime, datetime]:
-    now = datetime.now(timezone.utc)
+def _recent_period_utc(days: int = RECENT_ORDERS_DAYS, now: datetime | None = None) -> tuple[datetime, datetime]:
+    now = now or datetime.now(timezone.utc)
     return now - timedelta(days=days), now
 
 
@@ -264,18 +370,11 @@ def _map_wb_statistics_status(item: dict[str, Any]) -> OrderStatus:
 
 
 def _prevent_wb_status_rollback(current_status: OrderStatus, incoming_status: OrderStatus) -> OrderStatus:
-    terminal_statuses = {
-        OrderStatus.REJECTION,
-        OrderStatus.RETURN_STARTED,
-        OrderStatus.RETURN_IN_TRANSIT_FROM_BUYER,
-        OrderStatus.RETURN_ARRIVED_TO_SELLER_PICKUP,
-        OrderStatus.SELLER_PICKED_UP,
-        OrderStatus.DEFECT,
-    }
-    if incoming_status in terminal_statuses:
+    if incoming_status in WB_TERMINAL_STATUSES:
         return incoming_status
-    current_rank = WB_FORWARD_FUNNEL_INDEX.get(current_status)
-    incoming_rank = WB_FORWARD_FUNNEL_INDEX.get(incoming_status)
+    funnel_index = WB_FORWARD_FUNNEL_INDEX
+    current_rank = funnel_index.get(current_status)
+    incoming_rank = funnel_index.get(incoming_status)
     if current_rank is None or incoming_rank is None:
         return incoming_status
     if incoming_rank < current_rank:
@@ -284,61 +383,71 @@ def _prevent_wb_status_rollback(current_status: OrderStatus, incoming_status: Or
 
 
 def _map_ozon_status(raw_status: str | int | None) -> OrderStatus:
-    normalized = _normalize_status_text(raw_status)
-    if normalized in OZON_STATUS_MAP:
-        return OZON_STATUS_MAP[normalized]
-    if "cancel" in normalized or "not_accepted" in normalized:
-        return OrderStatus.REJECTION
-    if "return" in normalized and "to_seller" in normalized:
-        return OrderStatus.RETURN_ARRIVED_TO_SELLER_PICKUP
-    if "return" in normalized:
-        return OrderStatus.RETURN_STARTED
-    if "deliver" in normalized or "transit" in normalized:
-        return OrderStatus.IN_TRANSIT_TO_BUYER
+    # Статус приходит из JSON как есть (может быть и списком) — кэшируем уже нормализованную строку
+    return _map_ozon_status_text(_normalize_status_text(raw_status))
+
+
+@lru_cache(maxsize=256)
+def _map_ozon_status_text(normalized: str) -> OrderStatus:
+    status = OZON_STATUS_MAP.get(normalized)
+    if status is not None:
+        return status
+    for tokens, rule_status in _OZON_SUBSTR_RULES:
+        if all(token in normalized for token in tokens):
+            return rule_status
     return OrderStatus.NEW
 
 
-def _today_start_utc() -> datetime:
+@lru_cache(maxsize=4)
+def _zone(name: str) -> tzinfo:
     try:
-        tz = ZoneInfo(app_settings.timezone)
+        return ZoneInfo(name)
     except Exception:
-        tz = timezone.utc
-    now_local = datetime.now(tz)
-    start_local = now_local.replace(hour=0, minute=0, second=0, microsecond=0)
+        return timezone.utc
+
+
+@lru_cache(maxsize=4)
+def _day_start_utc(name: str, local_day: date) -> datetime:
+    start_local = datetime.combine(local_day, datetime.min.time(), tzinfo=_zone(name))
     return start_local.astimezone(timezone.utc)
 
 
+def today_start_utc() -> datetime:
+    """Начало текущих суток в часовом поясе приложения, в UTC. Граница кэшируется до смены даты."""
+    tz_name = app_settings.timezone
+    return _day_start_utc(tz_name, datetime.now(_zone(tz_name)).date())
+
+
 def _event_note(source_status: str) -> str:
     normalized = source_status.strip()
     return "Синхронизация API" if not normalized else f"Синхронизация API ({normalized})"
 
 
-def _event_to_read(event: OrderEvent) -> OrderEventRead:
+def _event_to_read(row: RowMapping) -> OrderEventRead:
     return OrderEventRead(
-        id=event.id,
-        status=event.status,
-        status_name=STATUS_LABELS[event.status],
-        event_at=_to_aware_utc(event.event_at),
-        note=event.note,
+        id=row["id"],
+        status=row["status"],
+        status_name=STATUS_LABELS[row["status"]],
+        event_at=_to_aware_utc(row["event_at"]),
+        note=row["note"],
     )
 
 
-def _order_to_read(order: Order) -> OrderRead:
-    events = sorted(order.events, key=lambda item: item.event_at, reverse=True)
+def _order_to_read(row: RowMapping, events: list[OrderEventRead]) -> OrderRead:
     return OrderRead(
-        id=order.id,
-        marketplace=order.marketplace,
-        marketplace_name=MARKETPLACE_LABELS[order.marketplace],
-        assembly_task_number=order.external_order_id,
-        product_name=order.product_name,
-        sku=order.sku,
-        quantity=order.quantity,
-        current_status=order.current_status,
-        current_status_name=STATUS_LABELS[order.current_status],
-        current_status_at=_to_aware_utc(order.current_status_at),
-        created_at=_to_aware_utc(order.created_at),
-        updated_at=_to_aware_utc(order.updated_at),
-        events=[_event_to_read(event) for event in events],
+        id=row["id"],
+        marketplace=row["marketplace"],
+        marketplace_name=MARKETPLACE_LABELS[row["marketplace"]],
+        assembly_task_number=row["external_order_id"],
+        product_name=row["product_name"],
+        sku=row["sku"],
+        quantity=row["quantity"],
+        current_status=row["current_status"],
+        current_status_name=STATUS_LABELS[row["current_status"]],
+        current_status_at=_to_aware_utc(row["current_status_at"]),
+        created_at=_to_aware_utc(row["created_at"]),
+        updated_at=_to_aware_utc(row["updated_at"]),
+        events=events,
     )
 
 
@@ -400,15 +509,40 @@ def list_orders(
                 Order.sku.ilike(needle),
             )
         )
-    base_query = select(Order).options(selectinload(Order.events))
+    # Только нужные колонки, без ORM объектов и identity map: строки сразу идут в схемы ответа
+    base_query = select(
+        Order.id,
+        Order.marketplace,
+        Order.external_order_id,
+        Order.product_name,
+        Order.sku,
+        Order.quantity,
+        Order.current_status,
+        Order.current_status_at,
+        Order.created_at,
+        Order.updated_at,
+    )
     count_query = select(func.count(Order.id))
     if filters:
         base_query = base_query.where(and_(*filters))
         count_query = count_query.where(and_(*filters))
     base_query = base_query.order_by(Order.current_status_at.desc(), Order.id.desc()).limit(limit).offset(offset)
-    items = list(session.scalars(base_query).all())
+    order_rows = session.execute(base_query).mappings().all()
+
+    # События страницы — вторым узким запросом, уже в порядке «новые сверху»
+    events_by_order: dict[int, list[OrderEventRead]] = {row["id"]: [] for row in order_rows}
+    if events_by_order:
+        event_rows = session.execute(
+            select(OrderEvent.order_id, OrderEvent.id, OrderEvent.status, OrderEvent.event_at, OrderEvent.note)
+            .where(OrderEvent.order_id.in_(list(events_by_order)))
+            .order_by(OrderEvent.order_id, OrderEvent.event_at.desc(), OrderEvent.id)
+        ).mappings()
+        for event_row in event_rows:
+            events_by_order[event_row["order_id"]].append(_event_to_read(event_row))
+
+    items = [_order_to_read(row, events_by_order[row["id"]]) for row in order_rows]
     total = int(session.scalar(count_query) or 0)
-    return ([_order_to_read(item) for item in items], total)
+    return (items, total)
 
 
 def list_recent_orders(session: Session, marketplace: Marketplace, limit: int = 10) -> list[OrderBrief]:
@@ -430,23 +564,26 @@ def list_recent_orders(session: Session, marketplace: Marketplace, limit: int =
     ]
 
 
-def build_summary(session: Session, marketplace: Marketplace) -> DashboardSummary:
-    today_start = _today_start_utc()
-    market_filter = Order.marketplace == marketplace
-    total_orders = int(session.scalar(select(func.count(Order.id)).where(market_filter)) or 0)
-    updated_today = int(
-        session.scalar(
-            select(func.count(Order.id)).where(market_filter, Order.updated_at >= today_start)
-        ) or 0
-    )
+def build_summary(
+    session: Session,
+    marketplace: Marketplace,
+    today_start: datetime | None = None,
+) -> DashboardSummary:
+    today_start = today_start or today_start_utc()
+    # Один запрос: количество по статусам и обновлённые сегодня — условной суммой
     grouped = session.execute(
-        select(Order.current_status, func.count(Order.id))
-        .where(market_filter)
+        select(
+            Order.current_status,
+            func.count(Order.id),
+            func.sum(case((Order.updated_at >= today_start, 1), else_=0)),
+        )
+        .where(Order.marketplace == marketplace)
         .group_by(Order.current_status)
     ).all()
-    by_status: dict[str, int] = {STATUS_LABELS[status]: 0 for status in OrderStatus}
-    for status, count in grouped:
-        by_status[STATUS_LABELS[status]] = int(count)
+    present: dict[OrderStatus, int] = {status: int(count) for status, count, _ in grouped}
+    by_status = {label: present.get(status, 0) for status, label in _ALL_STATUS_LABELS}
+    total_orders = sum(present.values())
+    updated_today = sum(int(updated_count or 0) for *_, updated_count in grouped)
     return DashboardSummary(
         marketplace=marketplace,
         marketplace_name=MARKETPLACE_LABELS[marketplace],
@@ -456,22 +593,17 @@ def build_summary(session: Session, marketplace: Marketplace) -> DashboardSummar
     )
 
 
-def build_today_summary(session: Session) -> TodaySummary:
-    today_start = _today_start_utc()
-    wb_updates = int(
-        session.scalar(
-            select(func.count(Order.id)).where(
-                Order.marketplace == Marketplace.WB, Order.updated_at >= today_start
-            )
-        ) or 0
-    )
-    ozon_updates = int(
-        session.scalar(
-            select(func.count(Order.id)).where(
-                Order.marketplace == Marketplace.OZON, Order.updated_at >= today_start
-            )
-        ) or 0
+def build_today_summary(session: Session, today_start: datetime | None = None) -> TodaySummary:
+    today_start = today_start or today_start_utc()
+    updates: dict[Marketplace, int] = dict(
+        session.execute(
+            select(Order.marketplace, func.count(Order.id))
+            .where(Order.updated_at >= today_start)
+            .group_by(Order.marketplace)
+        ).all()
     )
+    wb_updates = int(updates.get(Marketplace.WB, 0))
+    ozon_updates = int(updates.get(Marketplace.OZON, 0))
     return TodaySummary(
         date=today_start.date().isoformat(),
         wb_updates=wb_updates,
@@ -480,31 +612,130 @@ def build_today_summary(session: Session) -> TodaySummary:
     )
 
 
+def _fmt_ru_dt(value: datetime) -> str:
+    # То же, что strftime("%d.%m.%Y %H:%M"), но без разбора строки формата на каждый вызов
+    return f"{value.day:02d}.{value.month:02d}.{value.year:04d} {value.hour:02d}:{value.minute:02d}"
+
+
 def export_rows(session: Session) -> list[dict[str, str]]:
-    query = select(Order).options(selectinload(Order.events)).order_by(Order.marketplace, Order.current_status_at.desc())
-    orders = list(session.scalars(query).all())
+    # Заказы и события одним JOIN-курсором: история уже отсортирована в SQL,
+    # строки одного заказа идут подряд и собираются через groupby
+    query = (
+        select(
+            Order.id,
+            Order.marketplace,
+            Order.external_order_id,
+            Order.current_status,
+            Order.current_status_at,
+            OrderEvent.status,
+            OrderEvent.event_at,
+        )
+        .join(OrderEvent, OrderEvent.order_id == Order.id, isouter=True)
+        .order_by(Order.marketplace, Order.current_status_at.desc(), Order.id, OrderEvent.event_at, OrderEvent.id)
+    )
+    # Локальные ссылки на поиск подписей — без обращения к глобальным словарям на каждой строке
+    status_label = STATUS_LABELS.__getitem__
+    marketplace_label = MARKETPLACE_LABELS.__getitem__
+    fmt_dt = _fmt_ru_dt
     rows: list[dict[str, str]] = []
-    for order in orders:
-        events = sorted(order.events, key=lambda item: item.event_at)
+    for _, group in groupby(session.execute(query), key=itemgetter(0)):
+        order_rows = list(group)
+        _, marketplace, external_order_id, current_status, current_status_at, _, _ = order_rows[0]
         history = " | ".join(
-            f"{STATUS_LABELS[event.status]} ({_to_aware_utc(event.event_at).strftime('%d.%m.%Y %H:%M')})"
-            for event in events
+            f"{status_label(event_status)} ({fmt_dt(_to_aware_utc(event_at))})"
+            for *_, event_status, event_at in order_rows
+            if event_status is not None
         )
         rows.append({
-            "Маркетплейс": MARKETPLACE_LABELS[order.marketplace],
-            "Номер сборочного задания": order.external_order_id,
-            "Текущий статус": STATUS_LABELS[order.current_status],
-            "Дата текущего статуса": _to_aware_utc(order.current_status_at).strftime("%d.%m.%Y %H:%M"),
+            "Маркетплейс": marketplace_label(marketplace),
+            "Номер сборочного задания": external_order_id,
+            "Текущий статус": status_label(current_status),
+            "Дата текущего статуса": fmt_dt(_to_aware_utc(current_status_at)),
             "История статусов": history,
         })
     return rows
 
 
 def _log_ozon_postings_preview(postings: list[dict[str, Any]]) -> None:
+    if not logger.isEnabledFor(logging.INFO):
+        return
     preview = [{"id": str(item.get("posting_number") or item.get("id") or ""), "status": str(item.get("status") or "")} for item in postings[:3]]
     logger.info("Ozon API первые 3 заказа: %s", preview)
 
 
+def _parse_wb_supply_done(response: httpx.Response) -> bool:
+    """Читает только флаг done из ответа поставки, без разбора всего JSON."""
+    match = WB_SUPPLY_DONE_RE.search(response.content)
+    if match:
+        return match.group(1) == b"true"
+    data = orjson.loads(response.content)
+    return bool(data.get("done", False))
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _HTTP_CLIENT, _HTTP_CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    # Клиент из другого (например, уже закрытого) loop использовать нельзя — создаём новый;
+    # старый закрыть из этого loop невозможно, его соединения уйдут вместе со своим loop
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed or _HTTP_CLIENT_LOOP is not loop:
+        _HTTP_CLIENT_LOOP = loop
+        _HTTP_CLIENT = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0),
+        )
+    return _HTTP_CLIENT
+
+
+async def close_http_client() -> None:
+    """Закрывает общий HTTP клиент маркетплейсов (вызывается при остановке приложения)."""
+    global _HTTP_CLIENT, _HTTP_CLIENT_LOOP
+    client, client_loop = _HTTP_CLIENT, _HTTP_CLIENT_LOOP
+    _HTTP_CLIENT = _HTTP_CLIENT_LOOP = None
+    if client is not None and client_loop is asyncio.get_running_loop():
+        await client.aclose()
+
+
+async def _wb_get(client: httpx.AsyncClient, url: str, **kwargs: Any) -> httpx.Response:
+    await WB_RATE_LIMITER.acquire()
+    return await client.get(url, **kwargs)
+
+
+async def _ozon_post(client: httpx.AsyncClient, url: str, **kwargs: Any) -> httpx.Response:
+    await OZON_RATE_LIMITER.acquire()
+    return await client.post(url, **kwargs)
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """
+    Пауза перед повтором после 429. Если API прислал Retry-After — ждём не меньше него
+    (но не дольше MAX_RETRY_AFTER_SECONDS), иначе экспоненциальная пауза с full jitter,
+    чтобы параллельные запросы не повторялись разом.
+    """
+    try:
+        retry_after = float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        retry_after = None
+    if retry_after is not None and math.isfinite(retry_after) and retry_after >= 0:
+        return min(retry_after, MAX_RETRY_AFTER_SECONDS) + random.uniform(0, 1)
+    return random.uniform(0, 2.0 ** min(attempt + 1, 5))
+
+
+async def _request_with_retry(
+    api_name: str,
+    send: Callable[[], Awaitable[httpx.Response]],
+) -> httpx.Response:
+    """Повторяет запрос при 429 до MAX_RETRY_ATTEMPTS раз; последний ответ возвращается как есть."""
+    attempt = 0
+    while True:
+        response = await send()
+        _log_marketplace_response(api_name, response)
+        if response.status_code != 429 or attempt + 1 >= MAX_RETRY_ATTEMPTS:
+            return response
+        await asyncio.sleep(_retry_delay(response, attempt))
+        attempt += 1
+
+
 async def _fetch_wb_supply_statuses(
     client: httpx.AsyncClient,
     headers: dict[str, str],
@@ -529,7 +760,7 @@ async def _fetch_wb_supply_statuses(
         tasks = []
         for supply_id in batch:
             url = WB_SUPPLY_URL.format(supply_id=supply_id)
-            tasks.append(client.get(url, headers=headers))
+            tasks.append(_wb_get(client, url, headers=headers))
 
         responses = await asyncio.gather(*tasks, return_exceptions=True)
         for supply_id, response in zip(batch, responses):
@@ -539,8 +770,7 @@ async def _fetch_wb_supply_statuses(
                 continue
             try:
                 if response.status_code == 200:
-                    data = response.json()
-                    result[supply_id] = bool(data.get("done", False))
+                    result[supply_id] = _parse_wb_supply_done(response)
                     logger.debug("Поставка %s: done=%s", supply_id, result[supply_id])
                 else:
                     logger.warning("Поставка %s: статус %s", supply_id, response.status_code)
@@ -549,23 +779,33 @@ async def _fetch_wb_supply_statuses(
                 logger.warning("Ошибка парсинга поставки %s: %s", supply_id, e)
                 result[supply_id] = False
 
-        if i + batch_size < len(supply_list):
-            await asyncio.sleep(REQUEST_PAUSE_SECONDS)
-
     done_count = sum(1 for v in result.values() if v)
     logger.info("WB поставки: всего=%s сданных(done=True)=%s", len(result), done_count)
     return result
 
 
-def _normalize_wb_order(item: dict[str, Any], supply_done: bool = False) -> ExternalOrderSnapshot | None:
+def _first_text(item: dict[str, Any], keys: tuple[str, ...], limit: int) -> str | None:
+    """Первое непустое значение по ключам, приведённое к строке и обрезанное до limit."""
+    for key in keys:
+        value = item.get(key)
+        if value:
+            text = str(value).strip()
+            if text:
+                return text[:limit]
+    return None
+
+
+def _normalize_wb_order(
+    item: dict[str, Any],
+    supply_done: bool = False,
+    now: datetime | None = None,
+) -> ExternalOrderSnapshot | None:
     """
     assembly_task_number = числовой 'id' (номер сборочного задания)
     wb_rid               = 'rid' (для связки со Statistics API)
     supply_done          = True если поставка уже сдана на склад WB
     """
-    task_number = str(item.get("id") or "").strip()
-    if not task_number:
-        task_number = str(item.get("rid") or item.get("srid") or "").strip()
+    task_number = _first_text(item, _WB_TASK_KEYS, 128)
     if not task_number:
         return None
 
@@ -573,7 +813,7 @@ def _normalize_wb_order(item: dict[str, Any], supply_done: bool = False) -> Exte
     raw_supply_id = item.get("supplyId", item.get("supply_id"))
     status = _map_wb_status(raw_supply_id, supply_done)
 
-    status_at = _parse_datetime(item.get("updatedAt") or item.get("statusUpdatedAt") or item.get("createdAt"))
+    status_at = _parse_datetime(item.get("updatedAt") or item.get("statusUpdatedAt") or item.get("createdAt"), now=now)
     due_ship_at = _parse_datetime(item.get("deadline") or item.get("shipmentDate"), fallback=status_at)
 
     skus = item.get("skus")
@@ -596,7 +836,7 @@ def _normalize_wb_order(item: dict[str, Any], supply_done: bool = False) -> Exte
 
     return ExternalOrderSnapshot(
         marketplace=Marketplace.WB,
-        assembly_task_number=task_number[:128],
+        assembly_task_number=task_number,
         status=status,
         status_at=status_at,
         product_name=product_name[:256],
@@ -608,13 +848,15 @@ def _normalize_wb_order(item: dict[str, Any], supply_done: bool = False) -> Exte
     )
 
 
-def _normalize_ozon_order(item: dict[str, Any]) -> ExternalOrderSnapshot | None:
-    task_number = str(item.get("posting_number") or item.get("order_number") or item.get("order_id") or "").strip()
+def _normalize_ozon_order(item: dict[str, Any], now: datetime | None = None) -> ExternalOrderSnapshot | None:
+    task_number = _first_text(item, _OZON_TASK_KEYS, 128)
     if not task_number:
         return None
     raw_status = item.get("status")
     status = _map_ozon_status(raw_status)
-    status_at = _parse_datetime(item.get("in_process_at") or item.get("status_updated_at") or item.get("created_at"))
+    status_at = _parse_datetime(
+        item.get("in_process_at") or item.get("status_updated_at") or item.get("created_at"), now=now
+    )
     due_ship_at = _parse_datetime(item.get("shipment_date"), fallback=status_at)
     products = item.get("products") if isinstance(item.get("products"), list) else []
     if products:
@@ -628,7 +870,7 @@ def _normalize_ozon_order(item: dict[str, Any]) -> ExternalOrderSnapshot | None:
         quantity = 1
     return ExternalOrderSnapshot(
         marketplace=Marketplace.OZON,
-        assembly_task_number=task_number[:128],
+        assembly_task_number=task_number,
         status=status,
         status_at=status_at,
         product_name=product_name[:256],
@@ -639,7 +881,11 @@ def _normalize_ozon_order(item: dict[str, Any]) -> ExternalOrderSnapshot | None:
     )
 
 
-async def _fetch_wb_active_orders(wb_token: str) -> list[ExternalOrderSnapshot]:
+async def _fetch_wb_active_orders(
+    client: httpx.AsyncClient,
+    wb_token: str,
+    now: datetime | None = None,
+) -> list[ExternalOrderSnapshot]:
     """
     Получает активные заказы из /api/v3/orders.
     Для заказов с supplyId дополнительно запрашивает статус поставки:
@@ -649,148 +895,142 @@ async def _fetch_wb_active_orders(wb_token: str) -> list[ExternalOrderSnapshot]:
     headers = {"Authorization": wb_token.strip()}
     snapshots: list[ExternalOrderSnapshot] = []
     all_wb_orders: list[dict[str, Any]] = []
-    recent_from, _ = _recent_period_utc()
+    recent_from, now = _recent_period_utc(now=now)
     next_cursor: int | str = 0
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        # Новые заказы
-        response = await client.get(WB_NEW_ORDERS_URL, headers=headers)
-        _log_marketplace_response("WB", response)
-        try:
-            initial_payload: Any = response.json()
-        except ValueError:
-            initial_payload = response.text
+    # Новые заказы
+    response = await _request_with_retry("WB", lambda: _wb_get(client, WB_NEW_ORDERS_URL, headers=headers))
+    response.raise_for_status()
+    try:
+        initial_payload: Any = orjson.loads(response.content)
+    except ValueError:
+        initial_payload = response.text
+    all_wb_orders.extend(_extract_wb_orders(initial_payload))
+
+    # Все заказы с пагинацией
+    for _ in range(MAX_WB_PAGES):
+        params: dict[str, Any] = {"limit": 1000, "next": next_cursor}
+        response = await _request_with_retry(
+            "WB", lambda: _wb_get(client, WB_ORDERS_URL, headers=headers, params=params)
+        )
         if response.status_code == 429:
-            await asyncio.sleep(2.0)
-            response = await client.get(WB_NEW_ORDERS_URL, headers=headers)
-            try:
-                initial_payload = response.json()
-            except ValueError:
-                initial_payload = response.text
+            logger.warning("WB: 429 после %s попыток, пагинация остановлена", MAX_RETRY_ATTEMPTS)
+            break
         response.raise_for_status()
-        all_wb_orders.extend(_extract_wb_orders(initial_payload))
-
-        # Все заказы с пагинацией
-        for _ in range(MAX_WB_PAGES):
-            params: dict[str, Any] = {"limit": 1000, "next": next_cursor}
-            response = await client.get(WB_ORDERS_URL, headers=headers, params=params)
-            _log_marketplace_response("WB", response)
-            try:
-                payload: Any = response.json()
-            except ValueError:
-                payload = response.text
-            if response.status_code == 429:
-                await asyncio.sleep(2.0)
-                continue
-            response.raise_for_status()
-            orders_payload = _extract_wb_orders(payload)
-            if not orders_payload:
-                break
-            all_wb_orders.extend(orders_payload)
-            new_next = payload.get("next") if isinstance(payload, dict) else None
-            if new_next in (None, "", 0) or new_next == next_cursor:
-                break
-            next_cursor = new_next
-            await asyncio.sleep(REQUEST_PAUSE_SECONDS)
-
-        # Фильтруем по дате
-        recent_orders = []
-        for item in all_wb_orders:
-            created_at = _parse_datetime(item.get("createdAt"))
-            if created_at >= recent_from:
-                recent_orders.append(item)
-
-        logger.info("WB /api/v3/orders: всего=%s после фильтрации=%s", len(all_wb_orders), len(recent_orders))
-
-        # Собираем уникальные supplyId для заказов с поставкой
-        supply_ids: set[str] = set()
-        for item in recent_orders:
-            raw_supply_id = item.get("supplyId", item.get("supply_id"))
-            if _has_wb_supply_id(raw_supply_id):
-                supply_ids.add(str(raw_supply_id).strip())
-
-        # Запрашиваем статусы поставок
-        supply_statuses = await _fetch_wb_supply_statuses(client, headers, supply_ids)
-
-        # Нормализуем заказы с учётом статуса поставки
-        new_c = assembly_c = delivery_c = 0
-        for item in recent_orders:
-            raw_supply_id = item.get("supplyId", item.get("supply_id"))
-            supply_done = False
-            if _has_wb_supply_id(raw_supply_id):
-                supply_done = supply_statuses.get(str(raw_supply_id).strip(), False)
-
-            normalized = _normalize_wb_order(item, supply_done=supply_done)
-            if not normalized:
-                continue
+        try:
+            payload: Any = orjson.loads(response.content)
+        except ValueError:
+            payload = response.text
+        orders_payload = _extract_wb_orders(payload)
+        if not orders_payload:
+            break
+        all_wb_orders.extend(orders_payload)
+        new_next = payload.get("next") if isinstance(payload, dict) else None
+        if new_next in (None, "", 0) or new_next == next_cursor:
+            break
+        next_cursor = new_next
+
+    # Фильтруем по дате
+    recent_orders = []
+    for item in all_wb_orders:
+        created_at = _parse_datetime(item.get("createdAt"), now=now)
+        if created_at >= recent_from:
+            recent_orders.append(item)
+
+    logger.info("WB /api/v3/orders: всего=%s после фильтрации=%s", len(all_wb_orders), len(recent_orders))
+
+    # Собираем уникальные supplyId для заказов с поставкой
+    supply_ids: set[str] = set()
+    for item in recent_orders:
+        raw_supply_id = item.get("supplyId", item.get("supply_id"))
+        if _has_wb_supply_id(raw_supply_id):
+            supply_ids.add(str(raw_supply_id).strip())
+
+    # Запрашиваем статусы поставок
+    supply_statuses = await _fetch_wb_supply_statuses(client, headers, supply_ids)
+
+    # Нормализуем заказы с учётом статуса поставки
+    new_c = assembly_c = delivery_c = 0
+    for item in recent_orders:
+        raw_supply_id = item.get("supplyId", item.get("supply_id"))
+        supply_done = False
+        if _has_wb_supply_id(raw_supply_id):
+            supply_done = supply_statuses.get(str(raw_supply_id).strip(), False)
+
+        normalized = _normalize_wb_order(item, supply_done=supply_done, now=now)
+        if not normalized:
+            continue
 
-            if normalized.status == OrderStatus.NEW:
-                new_c += 1
-            elif normalized.status == OrderStatus.ASSEMBLY:
-                assembly_c += 1
-            else:
-                delivery_c += 1
+        if normalized.status == OrderStatus.NEW:
+            new_c += 1
+        elif normalized.status == OrderStatus.ASSEMBLY:
+            assembly_c += 1
+        else:
+            delivery_c += 1
 
-            snapshots.append(normalized)
+        snapshots.append(normalized)
 
-        logger.info(
-            "WB статусы: NEW=%s ASSEMBLY=%s TRANSFERRED_TO_DELIVERY=%s",
-            new_c, assembly_c, delivery_c,
-        )
+    logger.info(
+        "WB статусы: NEW=%s ASSEMBLY=%s TRANSFERRED_TO_DELIVERY=%s",
+        new_c, assembly_c, delivery_c,
+    )
 
     return snapshots
 
 
-async def _fetch_wb_statistics_snapshots(wb_token: str, recent_from: datetime) -> list[ExternalOrderSnapshot]:
+async def _fetch_wb_statistics_snapshots(
+    client: httpx.AsyncClient,
+    wb_token: str,
+    recent_from: datetime,
+    now: datetime | None = None,
+) -> list[ExternalOrderSnapshot]:
     """Завершённые заказы из Statistics API (BUYOUT / REJECTION)."""
     headers = {"Authorization": wb_token.strip()}
     snapshots: list[ExternalOrderSnapshot] = []
     date_from = recent_from.strftime("%Y-%m-%d")
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            response = await client.get(WB_STATISTICS_URL, headers=headers, params={"dateFrom": date_from})
-            _log_marketplace_response("WB Statistics", response)
-            if response.status_code == 429:
-                await asyncio.sleep(3.0)
-                response = await client.get(WB_STATISTICS_URL, headers=headers, params={"dateFrom": date_from})
-            response.raise_for_status()
-            data = response.json()
-            if not isinstance(data, list):
-                return snapshots
-
-            buyout_c = rejection_c = 0
-            for item in data:
-                if not isinstance(item, dict):
-                    continue
-                srid = str(item.get("srid") or "").strip()
-                if not srid:
-                    continue
-                status = _map_wb_statistics_status(item)
-                status_at = _parse_datetime(item.get("lastChangeDate") or item.get("date"))
-                sku = str(item.get("supplierArticle") or item.get("nmId") or "").strip() or None
-                product_name = str(item.get("subject") or item.get("category") or "").strip() or f"Заказ WB {srid}"
-                is_cancel = bool(item.get("isCancel"))
-                source_label = "isCancel=True" if is_cancel else "isRealization=True"
-                if status == OrderStatus.BUYOUT:
-                    buyout_c += 1
-                else:
-                    rejection_c += 1
-                snapshots.append(ExternalOrderSnapshot(
-                    marketplace=Marketplace.WB,
-                    assembly_task_number=srid[:128],
-                    status=status,
-                    status_at=status_at,
-                    product_name=product_name[:256],
-                    sku=sku[:128] if sku else None,
-                    quantity=1,
-                    due_ship_at=None,
-                    source_status=source_label,
-                    wb_rid=srid[:256],
-                ))
-            logger.info("WB Statistics: BUYOUT=%s REJECTION=%s итого=%s", buyout_c, rejection_c, len(snapshots))
-        except Exception:
-            logger.exception("Ошибка WB Statistics API")
+    try:
+        response = await _request_with_retry(
+            "WB Statistics",
+            lambda: client.get(WB_STATISTICS_URL, headers=headers, params={"dateFrom": date_from}, timeout=60.0),
+        )
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        if not isinstance(data, list):
+            return snapshots
+
+        buyout_c = rejection_c = 0
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            srid = str(item.get("srid") or "").strip()
+            if not srid:
+                continue
+            status = _map_wb_statistics_status(item)
+            status_at = _parse_datetime(item.get("lastChangeDate") or item.get("date"), now=now)
+            sku = str(item.get("supplierArticle") or item.get("nmId") or "").strip() or None
+            product_name = str(item.get("subject") or item.get("category") or "").strip() or f"Заказ WB {srid}"
+            is_cancel = bool(item.get("isCancel"))
+            source_label = "isCancel=True" if is_cancel else "isRealization=True"
+            if status == OrderStatus.BUYOUT:
+                buyout_c += 1
+            else:
+                rejection_c += 1
+            snapshots.append(ExternalOrderSnapshot(
+                marketplace=Marketplace.WB,
+                assembly_task_number=srid[:128],
+                status=status,
+                status_at=status_at,
+                product_name=product_name[:256],
+                sku=sku[:128] if sku else None,
+                quantity=1,
+                due_ship_at=None,
+                source_status=source_label,
+                wb_rid=srid[:256],
+            ))
+        logger.info("WB Statistics: BUYOUT=%s REJECTION=%s итого=%s", buyout_c, rejection_c, len(snapshots))
+    except Exception:
+        logger.exception("Ошибка WB Statistics API")
     return snapshots
 
 
@@ -805,135 +1045,300 @@ def _merge_wb_snapshots(
         if snap.wb_rid
     }
 
+    # Самое свежее время статуса среди активных по ключу заказа: Statistics-снимок
+    # старше него всё равно отбросит _collapse_snapshots, поэтому не добавляем его вовсе
+    latest_active: dict[tuple[Marketplace, str], datetime] = {}
+    for snap in active:
+        key = SNAPSHOT_KEY(snap)
+        if key not in latest_active or snap.status_at > latest_active[key]:
+            latest_active[key] = snap.status_at
+
     merged: list[ExternalOrderSnapshot] = list(active)
-    matched = unmatched = 0
+    matched = unmatched = skipped = 0
 
     for stat in statistics:
-        if stat.wb_rid and stat.wb_rid in rid_to_task:
-            stat = dataclasses.replace(stat, assembly_task_number=rid_to_task[stat.wb_rid])
+        task_number = rid_to_task.get(stat.wb_rid) if stat.wb_rid else None
+        if task_number is not None:
+            stat = stat._replace(assembly_task_number=task_number)
             matched += 1
         else:
             unmatched += 1
+        active_at = latest_active.get(SNAPSHOT_KEY(stat))
+        if active_at is not None and stat.status_at < active_at:
+            skipped += 1
+            continue
         merged.append(stat)
 
     logger.info(
-        "WB мёрж: активных=%s statistics=%s (matched=%s unmatched=%s) итого=%s",
-        len(active), len(statistics), matched, unmatched, len(merged),
+        "WB мёрж: активных=%s statistics=%s (matched=%s unmatched=%s skipped=%s) итого=%s",
+        len(active), len(statistics), matched, unmatched, skipped, len(merged),
     )
     return merged
 
 
-async def _fetch_all_wb_orders(wb_token: str) -> list[ExternalOrderSnapshot]:
-    recent_from, _ = _recent_period_utc()
-    active_task = asyncio.create_task(_fetch_wb_active_orders(wb_token))
-    await asyncio.sleep(REQUEST_PAUSE_SECONDS)
-    statistics_task = asyncio.create_task(_fetch_wb_statistics_snapshots(wb_token, recent_from))
+async def _fetch_all_wb_orders(
+    client: httpx.AsyncClient,
+    wb_token: str,
+    now: datetime | None = None,
+) -> list[ExternalOrderSnapshot]:
+    recent_from, now = _recent_period_utc(now=now)
+    active_task = asyncio.create_task(_fetch_wb_active_orders(client, wb_token, now))
+    statistics_task = asyncio.create_task(_fetch_wb_statistics_snapshots(client, wb_token, recent_from, now))
     active_snapshots = await active_task
     statistics_snapshots = await statistics_task
     return _merge_wb_snapshots(active_snapshots, statistics_snapshots)
 
 
-async def _fetch_ozon_orders(ozon_client_id: str, ozon_api_key: str) -> list[ExternalOrderSnapshot]:
+async def _fetch_ozon_page(
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    headers: dict[str, str],
+    since_dt: datetime,
+    to_dt: datetime,
+    offset: int,
+) -> tuple[list[dict[str, Any]], bool]:
+    """Одна страница Ozon FBS списка. Возвращает (postings, has_next)."""
+    body = {
+        "dir": "ASC",
+        "filter": {"since": _to_iso8601_utc(since_dt), "to": _to_iso8601_utc(to_dt)},
+        "limit": OZON_PAGE_SIZE,
+        "offset": offset,
+        "with": {"analytics_data": False, "financial_data": False},
+    }
+    request_content = orjson.dumps(body)
+    async with semaphore:
+        response = await _request_with_retry(
+            "Ozon", lambda: _ozon_post(client, OZON_FBS_LIST_URL, headers=headers, content=request_content)
+        )
+    response.raise_for_status()
+    payload = orjson.loads(response.content)
+    result = payload.get("result") or {}
+    postings = result.get("postings") or []
+    if not isinstance(postings, list):
+        return [], False
+    postings_dicts = _only_dicts(postings)
+    _log_ozon_postings_preview(postings_dicts)
+    return postings_dicts, bool(result.get("has_next")) and bool(postings)
+
+
+def _normalize_ozon_page(
+    postings: list[dict[str, Any]],
+    now: datetime | None = None,
+) -> list[ExternalOrderSnapshot]:
+    snapshots: list[ExternalOrderSnapshot] = []
+    for item in postings:
+        normalized = _normalize_ozon_order(item, now)
+        if normalized:
+            snapshots.append(normalized)
+    return snapshots
+
+
+async def _fetch_ozon_orders(
+    client: httpx.AsyncClient,
+    ozon_client_id: str,
+    ozon_api_key: str,
+    sink: asyncio.Queue[list[ExternalOrderSnapshot] | None],
+    now: datetime | None = None,
+) -> None:
+    """
+    Первая страница запрашивается отдельно; если есть продолжение, следующие
+    страницы запрашиваются окнами по OZON_PAGE_CONCURRENCY штук параллельно.
+    Каждая нормализованная страница сразу кладётся в sink на запись в БД.
+    """
     headers = {
         "Client-Id": ozon_client_id.strip(),
         "Api-Key": ozon_api_key.strip(),
         "Content-Type": "application/json",
     }
-    snapshots: list[ExternalOrderSnapshot] = []
-    offset = 0
-    since_dt, to_dt = _recent_period_utc()
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        for _ in range(MAX_OZON_PAGES):
-            body = {
-                "dir": "ASC",
-                "filter": {"since": _to_iso8601_utc(since_dt), "to": _to_iso8601_utc(to_dt)},
-                "limit": 50,
-                "offset": offset,
-                "with": {"analytics_data": False, "financial_data": False},
-            }
-            response = await client.post(OZON_FBS_LIST_URL, headers=headers, json=body)
-            _log_marketplace_response("Ozon", response)
-            if response.status_code == 429:
-                await asyncio.sleep(2.0)
-                continue
-            response.raise_for_status()
-            payload = response.json()
-            result = payload.get("result") or {}
-            postings = result.get("postings") or []
-            if not isinstance(postings, list):
+    since_dt, to_dt = _recent_period_utc(now=now)
+    semaphore = asyncio.Semaphore(OZON_PAGE_CONCURRENCY)
+
+    async def emit(postings: list[dict[str, Any]]) -> None:
+        page_snapshots = _normalize_ozon_page(postings, to_dt)
+        if page_snapshots:
+            await sink.put(page_snapshots)
+
+    postings, has_next = await _fetch_ozon_page(client, semaphore, headers, since_dt, to_dt, 0)
+    await emit(postings)
+    next_page = 1
+    while has_next and next_page < MAX_OZON_PAGES:
+        window = range(next_page, min(next_page + OZON_PAGE_CONCURRENCY, MAX_OZON_PAGES))
+        # return_exceptions: ошибка одной страницы не отменяет уже полученные страницы окна
+        results = await asyncio.gather(*(
+            _fetch_ozon_page(client, semaphore, headers, since_dt, to_dt, page * OZON_PAGE_SIZE)
+            for page in window
+        ), return_exceptions=True)
+        # Страницы отдаются по порядку до первой с has_next=False; всё после неё запрошено
+        # спекулятивно и отбрасывается, включая ошибки. Ошибка до последней страницы — настоящая
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+            postings, has_next = result
+            await emit(postings)
+            if not has_next:
                 break
-            postings_dicts = [item for item in postings if isinstance(item, dict)]
-            _log_ozon_postings_preview(postings_dicts)
-            for item in postings_dicts:
-                normalized = _normalize_ozon_order(item)
-                if normalized:
-                    snapshots.append(normalized)
-            if not bool(result.get("has_next")) or not postings:
-                break
-            offset += 50
-            await asyncio.sleep(REQUEST_PAUSE_SECONDS)
-    return snapshots
+        next_page = window.stop
 
 
-def _collapse_snapshots(items: list[ExternalOrderSnapshot]) -> list[ExternalOrderSnapshot]:
-    collapsed: dict[tuple[Marketplace, str], ExternalOrderSnapshot] = {}
-    for item in items:
-        key = (item.marketplace, item.assembly_task_number)
-        current = collapsed.get(key)
-        if not current or item.status_at >= current.status_at:
-            collapsed[key] = item
-    return list(collapsed.values())
+def _collapse_snapshots(*sources: Iterable[ExternalOrderSnapshot]) -> list[ExternalOrderSnapshot]:
+    """Оставляет по одному снимку на (marketplace, номер) — с самым поздним status_at."""
+    # Один проход по источникам без промежуточного объединённого и отсортированного списка;
+    # при равном status_at остаётся более поздний элемент
+    latest: dict[tuple[Marketplace, str], ExternalOrderSnapshot] = {}
+    for item in chain(*sources):
+        key = SNAPSHOT_KEY(item)
+        current = latest.get(key)
+        if current is None or item.status_at >= current.status_at:
+            latest[key] = item
+    return list(latest.values())
 
 
-def _is_duplicate_event(order: Order, status: OrderStatus, event_at: datetime) -> bool:
-    for event in order.events:
-        if event.status != status:
-            continue
-        if abs((_to_aware_utc(event.event_at) - event_at).total_seconds()) < 1:
-            return True
-    return False
+EventKey = tuple[OrderStatus, int]
+# Ключи истории по заказу. Ключ словаря — сам объект Order, а не order.id:
+# у заказов, созданных в этом же проходе, id появляется только после общего INSERT
+EventKeys = dict[Order, set[EventKey]]
+
+
+def _event_key(status: OrderStatus, event_at: datetime) -> EventKey:
+    # Секундная точность: события в одной и той же целой секунде считаются одинаковыми
+    return status, int(_to_aware_utc(event_at).timestamp())
 
 
 def _looks_like_srid(value: str) -> bool:
     """srid содержит буквы или точки — это не числовой id WB"""
-    return any(c.isalpha() or c == '.' for c in value)
+    return SRID_CHARS_RE.search(value) is not None
 
 
-def _upsert_snapshot(session: Session, snapshot: ExternalOrderSnapshot) -> tuple[bool, bool]:
-    # Сначала ищем по external_order_id
-    query = (
-        select(Order)
-        .where(
-            Order.marketplace == snapshot.marketplace,
-            Order.external_order_id == snapshot.assembly_task_number,
+def _prefetch_orders(
+    session: Session,
+    snapshots: list[ExternalOrderSnapshot],
+) -> tuple[dict[tuple[Marketplace, str], Order], dict[tuple[Marketplace, str], Order], EventKeys]:
+    """
+    Загружает существующие заказы для всех снимков пачками вместо двух запросов на снимок.
+    Возвращает словари {(marketplace, external_order_id): Order}, {(marketplace, wb_rid): Order}
+    (при дублях остаётся заказ с максимальным id) и ключи истории событий заказов.
+    """
+    # Номера группируются по маркетплейсу: простой IN по external_order_id / wb_rid
+    # использует одноколоночные индексы, в отличие от IN по кортежу (marketplace, номер)
+    ext_ids: dict[Marketplace, set[str]] = {}
+    rid_ids: dict[Marketplace, set[str]] = {}
+    for item in snapshots:
+        ext_ids.setdefault(item.marketplace, set()).add(item.assembly_task_number)
+        if item.wb_rid and _looks_like_srid(item.assembly_task_number):
+            rid_ids.setdefault(item.marketplace, set()).add(item.wb_rid)
+
+    by_ext: dict[tuple[Marketplace, str], Order] = {}
+    by_rid: dict[tuple[Marketplace, str], Order] = {}
+    for marketplace, ext_set in ext_ids.items():
+        ext_list = list(ext_set)
+        rid_set = rid_ids.get(marketplace, set())
+        rid_list = list(rid_set)
+        # Поиск по external_order_id и по wb_rid объединён в один запрос на пачку через OR
+        for i in range(0, max(len(ext_list), len(rid_list)), PREFETCH_CHUNK_SIZE):
+            conditions = []
+            ext_chunk = ext_list[i:i + PREFETCH_CHUNK_SIZE]
+            if ext_chunk:
+                conditions.append(Order.external_order_id.in_(ext_chunk))
+            rid_chunk = rid_list[i:i + PREFETCH_CHUNK_SIZE]
+            if rid_chunk:
+                conditions.append(Order.wb_rid.in_(rid_chunk))
+            query = (
+                select(Order)
+                .where(Order.marketplace == marketplace, or_(*conditions))
+                .options(raiseload(Order.events))
+                .order_by(Order.id)
+            )
+            # Пачки ext и rid режутся независимо, и заказ может прийти повторно в более
+            # поздней пачке через wb_rid — поэтому при дублях явно оставляем максимальный id
+            for order in session.scalars(query):
+                ext_key = (marketplace, order.external_order_id)
+                current = by_ext.get(ext_key)
+                if current is None or order.id > current.id:
+                    by_ext[ext_key] = order
+                if order.wb_rid in rid_set:
+                    rid_key = (marketplace, order.wb_rid)
+                    current = by_rid.get(rid_key)
+                    if current is None or order.id > current.id:
+                        by_rid[rid_key] = order
+
+    # История нужна только для проверки дублей при смене статуса, поэтому события
+    # грузим одним запросом и только для заказов, у которых статус в снимке другой
+    changing_ids = list({
+        order.id
+        for item in snapshots
+        if (order := _find_order(item, by_ext, by_rid)) is not None
+        and order.current_status != item.status
+    })
+    orders_by_id = {order.id: order for order in (*by_ext.values(), *by_rid.values())}
+    event_keys: EventKeys = {}
+    # event_at каждого события приводится к UTC один раз здесь, а не на каждом снимке
+    for i in range(0, len(changing_ids), PREFETCH_CHUNK_SIZE):
+        rows = session.execute(
+            select(OrderEvent.order_id, OrderEvent.status, OrderEvent.event_at)
+            .where(OrderEvent.order_id.in_(changing_ids[i:i + PREFETCH_CHUNK_SIZE]))
         )
-        .options(selectinload(Order.events))
-        .order_by(Order.id.desc())
-    )
-    order = session.scalar(query)
+        for order_id, status, event_at in rows:
+            event_keys.setdefault(orders_by_id[order_id], set()).add(_event_key(status, event_at))
+
+    return by_ext, by_rid, event_keys
+
+
+@dataclass(slots=True)
+class PendingWrites:
+    """Изменения одной синхронизации; пишутся в БД пачками в _write_pending."""
+    new_orders: list[Order] = field(default_factory=list)
+    updated_orders: dict[int, Order] = field(default_factory=dict)
+    events: list[tuple[Order, dict[str, Any]]] = field(default_factory=list)
+    # Одно значение updated_at на всю пачку вместо datetime.now() на каждый заказ
+    now: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+ORDER_SYNC_COLUMNS = (
+    "wb_rid",
+    "product_name",
+    "sku",
+    "quantity",
+    "due_ship_at",
+    "current_status",
+    "current_status_at",
+)
+
+
+def _find_order(
+    snapshot: ExternalOrderSnapshot,
+    by_ext: dict[tuple[Marketplace, str], Order],
+    by_rid: dict[tuple[Marketplace, str], Order],
+) -> Order | None:
+    # Сначала ищем по external_order_id
+    order = by_ext.get(SNAPSHOT_KEY(snapshot))
 
     # Если не нашли по external_order_id, и номер выглядит как srid,
     # ищем по wb_rid (srid из Statistics == rid из /api/v3/orders == wb_rid в БД)
     if not order and snapshot.wb_rid and _looks_like_srid(snapshot.assembly_task_number):
-        order = session.scalar(
-            select(Order)
-            .where(
-                Order.marketplace == snapshot.marketplace,
-                Order.wb_rid == snapshot.wb_rid,
-            )
-            .options(selectinload(Order.events))
-            .order_by(Order.id.desc())
-        )
+        order = by_rid.get((snapshot.marketplace, snapshot.wb_rid))
         if order:
-            # Обновляем assembly_task_number на числовой id из БД
             logger.debug(
                 "WB Statistics: найден заказ по wb_rid=%s → id=%s",
                 snapshot.wb_rid, order.external_order_id,
             )
+    return order
+
 
+def _upsert_snapshot(
+    snapshot: ExternalOrderSnapshot,
+    by_ext: dict[tuple[Marketplace, str], Order],
+    by_rid: dict[tuple[Marketplace, str], Order],
+    event_keys: EventKeys,
+    writes: PendingWrites,
+) -> tuple[bool, bool]:
+    """
+    Применяет снимок к заказу в памяти и складывает изменения в writes.
+    В БД ничего не пишет — это делает _write_pending одним запросом на вид изменений.
+    """
+    order = _find_order(snapshot, by_ext, by_rid)
     created = False
     event_created = False
+    note = _event_note(snapshot.source_status)
 
     if not order:
         order = Order(
@@ -948,16 +1353,22 @@ def _upsert_snapshot(session: Session, snapshot: ExternalOrderSnapshot) -> tuple
             current_status_at=snapshot.status_at,
             comment="Синхронизация API WB/Ozon",
         )
-        order.events.append(OrderEvent(
-            status=snapshot.status,
-            event_at=snapshot.status_at,
-            note=_event_note(snapshot.source_status),
-        ))
-        session.add(order)
+        event_keys[order] = {_event_key(snapshot.status, snapshot.status_at)}
+        writes.new_orders.append(order)
+        writes.events.append((order, {
+            "status": snapshot.status,
+            "event_at": snapshot.status_at,
+            "note": note,
+        }))
+        by_ext[(order.marketplace, order.external_order_id)] = order
+        if order.wb_rid:
+            by_rid[(order.marketplace, order.wb_rid)] = order
         return True, True
 
+    wb_rid_filled = False
     if snapshot.wb_rid and not order.wb_rid:
         order.wb_rid = snapshot.wb_rid
+        wb_rid_filled = True
 
     old_status = order.current_status
     next_status = snapshot.status
@@ -973,27 +1384,187 @@ def _upsert_snapshot(session: Session, snapshot: ExternalOrderSnapshot) -> tuple
                 order.external_order_id, old_status.value, snapshot.status.value,
             )
 
-    if not rollback_blocked and next_status != old_status:
-        order.product_name = snapshot.product_name or order.product_name
-        if snapshot.sku:
-            order.sku = snapshot.sku
-        order.quantity = max(snapshot.quantity, 1)
-        order.due_ship_at = snapshot.due_ship_at or order.due_ship_at
-
-        if not _is_duplicate_event(order, next_status, snapshot.status_at):
-            order.events.append(OrderEvent(
-                status=next_status,
-                event_at=snapshot.status_at,
-                note=_event_note(snapshot.source_status),
-            ))
-            event_created = True
+    # Статус не меняется — заказ в UPDATE не попадает (кроме дозаполнения wb_rid)
+    if rollback_blocked or next_status == old_status:
+        if wb_rid_filled:
+            _mark_order_updated(order, writes)
+        return False, False
+
+    order.product_name = snapshot.product_name or order.product_name
+    if snapshot.sku:
+        order.sku = snapshot.sku
+    order.quantity = max(snapshot.quantity, 1)
+    order.due_ship_at = snapshot.due_ship_at or order.due_ship_at
+
+    # Проверка дубля — O(1) по множеству (status, секунда) вместо прохода по истории
+    order_event_keys = event_keys.setdefault(order, set())
+    key = _event_key(next_status, snapshot.status_at)
+    if key not in order_event_keys:
+        order_event_keys.add(key)
+        writes.events.append((order, {
+            "status": next_status,
+            "event_at": snapshot.status_at,
+            "note": note,
+        }))
+        event_created = True
+
+    order.current_status = next_status
+    order.current_status_at = snapshot.status_at
+    _mark_order_updated(order, writes)
+    return created, event_created
 
-        order.current_status = next_status
-        order.current_status_at = snapshot.status_at
-        order.updated_at = datetime.now(timezone.utc)
 
-    session.add(order)
-    return created, event_created
+def _mark_order_updated(order: Order, writes: PendingWrites) -> None:
+    # У новых заказов (созданных в этом же проходе) id ещё нет — они уйдут в общий INSERT
+    if order.id is not None:
+        order.updated_at = writes.now
+        writes.updated_orders[order.id] = order
+
+
+def _write_pending(session: Session, writes: PendingWrites) -> None:
+    """
+    Новые заказы — один INSERT ... RETURNING id, изменённые — один executemany UPDATE
+    по первичному ключу, события — один INSERT.
+    """
+    if writes.new_orders:
+        order_ids = session.scalars(
+            insert(Order).returning(Order.id, sort_by_parameter_order=True),
+            [
+                {
+                    "marketplace": order.marketplace,
+                    "external_order_id": order.external_order_id,
+                    "comment": order.comment,
+                    **{column: getattr(order, column) for column in ORDER_SYNC_COLUMNS},
+                }
+                for order in writes.new_orders
+            ],
+        ).all()
+        for order, order_id in zip(writes.new_orders, order_ids):
+            order.id = order_id
+
+    if writes.updated_orders:
+        session.execute(
+            update(Order),
+            [
+                {
+                    "id": order.id,
+                    "updated_at": order.updated_at,
+                    **{column: getattr(order, column) for column in ORDER_SYNC_COLUMNS},
+                }
+                for order in writes.updated_orders.values()
+            ],
+        )
+
+    if writes.events:
+        session.execute(
+            insert(OrderEvent),
+            [{"order_id": order.id, **values} for order, values in writes.events],
+        )
+
+
+def _persist_snapshots(snapshots: list[ExternalOrderSnapshot]) -> tuple[int, int]:
+    """
+    Синхронная запись снимков в БД. Возвращает (created_orders, created_events).
+    Вызывается через asyncio.to_thread, чтобы не блокировать event loop.
+    """
+    created_orders = created_events = 0
+
+    with session_scope() as session:
+        by_ext, by_rid, event_keys = _prefetch_orders(session, snapshots)
+        # Дальше заказы — просто данные: изменения пишутся явными пакетными запросами,
+        # а не через отслеживание изменений ORM
+        session.expunge_all()
+        writes = PendingWrites()
+        for snapshot in snapshots:
+            created, event_created = _upsert_snapshot(snapshot, by_ext, by_rid, event_keys, writes)
+            if created:
+                created_orders += 1
+            if event_created:
+                created_events += 1
+        _write_pending(session, writes)
+
+    return created_orders, created_events
+
+
+_SYNC_SOURCE_NAMES = {Marketplace.WB: "WB", Marketplace.OZON: "Ozon"}
+
+
+@dataclass(slots=True)
+class SyncWriteStats:
+    """Итоги записи пачек одной синхронизации."""
+    # Сколько снимков пришло от каждого маркетплейса — независимо от успеха записи
+    received: dict[Marketplace, int] = field(default_factory=dict)
+    # Самый поздний записанный status_at по каждому (marketplace, номер) за синхронизацию
+    written: dict[tuple[Marketplace, str], datetime] = field(default_factory=dict)
+    created_orders: int = 0
+    created_events: int = 0
+    # Подписи пачек вида «Ozon №2» — какие записаны, а какие нет
+    committed: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+
+    @property
+    def processed_orders(self) -> int:
+        return len(self.written)
+
+    @property
+    def updated_orders(self) -> int:
+        # Заказ создаётся не более одного раза, всё остальное по нему — обновления
+        return len(self.written) - self.created_orders
+
+
+async def _persist_snapshot_batches(
+    queue: asyncio.Queue[list[ExternalOrderSnapshot] | None],
+) -> SyncWriteStats:
+    """
+    Забирает пачки снимков из очереди и пишет их в БД, пока не придёт None.
+    Каждая пачка — своя транзакция: ошибка записи одной пачки логируется,
+    а остальные (в том числе пачка WB) всё равно пишутся.
+    """
+    stats = SyncWriteStats()
+    batch_numbers: dict[Marketplace, int] = {}
+    while (batch := await queue.get()) is not None:
+        marketplace = batch[0].marketplace
+        batch_numbers[marketplace] = number = batch_numbers.get(marketplace, 0) + 1
+        label = f"{_SYNC_SOURCE_NAMES[marketplace]} №{number}"
+        stats.received[marketplace] = stats.received.get(marketplace, 0) + len(batch)
+        # Пагинация по offset может отдать один заказ на двух страницах: снимок не новее
+        # уже записанного отбрасываем, иначе статус Ozon откатился бы назад
+        fresh = [
+            snapshot
+            for snapshot in _collapse_snapshots(batch)
+            if (written_at := stats.written.get(SNAPSHOT_KEY(snapshot))) is None
+            or snapshot.status_at > written_at
+        ]
+        if fresh:
+            try:
+                created, events = await asyncio.to_thread(_persist_snapshots, fresh)
+            except Exception:
+                logger.exception("Не удалось записать пачку %s", label)
+                stats.failed.append(label)
+                continue
+            for snapshot in fresh:
+                stats.written[SNAPSHOT_KEY(snapshot)] = snapshot.status_at
+            stats.created_orders += created
+            stats.created_events += events
+        stats.committed.append(label)
+    return stats
+
+
+async def _enter_advisory_lock(stack: ExitStack) -> bool:
+    """
+    Берёт advisory lock синхронизации в потоке и регистрирует освобождение в stack.
+    Отмена не останавливает поток: он всё равно возьмёт блокировку и соединение из пула,
+    поэтому при отмене stack закрывается сразу после того, как поток закончит захват.
+    """
+    loop = asyncio.get_running_loop()
+    acquire = asyncio.ensure_future(
+        asyncio.to_thread(stack.enter_context, advisory_lock(SYNC_ADVISORY_KEY))
+    )
+    try:
+        return await asyncio.shield(acquire)
+    except asyncio.CancelledError:
+        acquire.add_done_callback(lambda _: loop.run_in_executor(None, stack.close))
+        raise
 
 
 async def sync_orders_from_marketplaces() -> SyncReport:
@@ -1005,47 +1576,85 @@ async def sync_orders_from_marketplaces() -> SyncReport:
         )
 
     async with SYNC_LOCK:
-        with session_scope() as session:
-            cfg = get_settings(session)
-            wb_token = cfg.wb_token
-            ozon_client_id = cfg.ozon_client_id
-            ozon_api_key = cfg.ozon_api_key
-
-        wb_snapshots: list[ExternalOrderSnapshot] = []
-        ozon_snapshots: list[ExternalOrderSnapshot] = []
-
+        # SYNC_LOCK защищает только текущий процесс — между воркерами блокируемся в БД.
+        # Захват и освобождение advisory lock — блокирующие обращения к БД, поэтому в потоке
+        stack = ExitStack()
+        acquired = await _enter_advisory_lock(stack)
         try:
-            if wb_token:
-                wb_snapshots = await _fetch_all_wb_orders(wb_token)
-                await asyncio.sleep(REQUEST_PAUSE_SECONDS)
-        except Exception:
-            logger.exception("Не удалось получить заказы WB")
+            if not acquired:
+                return SyncReport(
+                    wb_received=0, ozon_received=0, processed_orders=0,
+                    created_orders=0, updated_orders=0, created_events=0,
+                    message="Синхронизация уже выполняется в другом процессе",
+                )
+            return await _run_sync()
+        finally:
+            await asyncio.to_thread(stack.close)
+
+
+def _read_sync_settings() -> SettingsRead:
+    with session_scope() as session:
+        return get_settings(session)
+
+
+async def _run_sync() -> SyncReport:
+    # Все обращения к синхронной БД идут через asyncio.to_thread и не блокируют event loop
+    cfg = await asyncio.to_thread(_read_sync_settings)
+    wb_token = cfg.wb_token
+    ozon_client_id = cfg.ozon_client_id
+    ozon_api_key = cfg.ozon_api_key
+
+    # Одно «сейчас» на всю синхронизацию: окно выборки и подстановка вместо пустых дат
+    now_utc = datetime.now(timezone.utc)
+    wb_snapshots: list[ExternalOrderSnapshot] = []
+
+    # Страницы Ozon пишутся в БД по мере загрузки, пока запрашиваются следующие
+    queue: asyncio.Queue[list[ExternalOrderSnapshot] | None] = asyncio.Queue(maxsize=4)
+    persister = asyncio.create_task(_persist_snapshot_batches(queue))
+    try:
+        # Клиент общий на процесс: внутри синхронизации соединения (и HTTP/2) переиспользуются.
+        # Между плановыми запусками (15 минут) keep-alive (60 с) истекает — соединения открываются заново
+        client = _get_http_client()
+        # WB и Ozon независимы — запрашиваем их параллельно
+        fetches: dict[str, asyncio.Task[Any]] = {}
+        if wb_token:
+            fetches["WB"] = asyncio.create_task(_fetch_all_wb_orders(client, wb_token, now_utc))
+        if ozon_client_id and ozon_api_key:
+            fetches["Ozon"] = asyncio.create_task(
+                _fetch_ozon_orders(client, ozon_client_id, ozon_api_key, sink=queue, now=now_utc)
+            )
 
-        try:
-            if ozon_client_id and ozon_api_key:
-                ozon_snapshots = await _fetch_ozon_orders(ozon_client_id, ozon_api_key)
-        except Exception:
-            logger.exception("Не удалось получить заказы Ozon")
-
-        all_snapshots = _collapse_snapshots([*wb_snapshots, *ozon_snapshots])
-        created_orders = updated_orders = created_events = 0
-
-        with session_scope() as session:
-            for snapshot in all_snapshots:
-                created, event_created = _upsert_snapshot(session, snapshot)
-                if created:
-                    created_orders += 1
-                else:
-                    updated_orders += 1
-                if event_created:
-                    created_events += 1
+        results = await asyncio.gather(*fetches.values(), return_exceptions=True)
 
-        return SyncReport(
-            wb_received=len(wb_snapshots),
-            ozon_received=len(ozon_snapshots),
-            processed_orders=len(all_snapshots),
-            created_orders=created_orders,
-            updated_orders=updated_orders,
-            created_events=created_events,
-            message="Синхронизация завершена",
+        for api_name, result in zip(fetches, results):
+            if isinstance(result, BaseException):
+                logger.error("Не удалось получить заказы %s", api_name, exc_info=result)
+                continue
+            # Страницы Ozon уже ушли в очередь — их учитывает persister
+            if api_name == "WB":
+                wb_snapshots = result
+
+        # WB снимки нужно целиком смёржить со Statistics, поэтому они уходят одной пачкой
+        if wb_snapshots:
+            await queue.put(wb_snapshots)
+        await queue.put(None)
+        stats = await persister
+    finally:
+        if not persister.done():
+            persister.cancel()
+
+    message = "Синхронизация завершена"
+    if stats.failed:
+        message = (
+            "Синхронизация завершена с ошибками записи. "
+            f"Записаны: {', '.join(stats.committed) or 'нет'}; не записаны: {', '.join(stats.failed)}"
         )
+    return SyncReport(
+        wb_received=stats.received.get(Marketplace.WB, 0),
+        ozon_received=stats.received.get(Marketplace.OZON, 0),
+        processed_orders=stats.processed_orders,
+        created_orders=stats.created_orders,
+        updated_orders=stats.updated_orders,
+        created_events=stats.created_events,
+        message=message,
+    )